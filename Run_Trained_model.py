@@ -46,7 +46,14 @@
 
 
 import argparse
+import io
+import mmap
+import os
+import queue
+import threading
+
 import numpy as np
+import pandas as pd
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -54,6 +61,24 @@ import torch.nn.functional as F
 
 # ===================== PointNetReg (v + c output) ==========================
 
+@torch.jit.script
+def _canonicalize(raw: torch.Tensor):
+    """
+    Splits the raw (B,6) head output into (v, c): v normalized to unit
+    length, c projected perpendicular to v. Scripted so the whole tail
+    (normalize + dot + subtract) is fused into one compiled region instead
+    of 4-5 separate kernel launches on tiny (B,3) tensors.
+    """
+    v_raw = raw[:, 0:3]
+    c_raw = raw[:, 3:6]
+
+    v = F.normalize(v_raw, dim=1, eps=1e-8)
+
+    dot = (c_raw * v).sum(dim=1, keepdim=True)
+    c = c_raw - dot * v
+
+    return v, c
+
 class PointNetReg(nn.Module):
     def __init__(self, feat_dims=(64, 128, 256), head_dims=(256, 128), dropout_p=0.3):
         super().__init__()
@@ -89,114 +114,454 @@ class PointNetReg(nn.Module):
     def forward(self, x):
         # x: (B, N, 3)
         if x.dim() != 3 or x.size(-1) != 3:
-            raise ValueError(f"Expected input shape (B, N, 3), got {tuple(x.shape)}")
+            # keep the message TorchScript-friendly (no tuple() formatting)
+            raise ValueError("Expected input shape (B, N, 3)")
 
         x = x.transpose(1, 2)  # (B, 3, N)
         x = F.relu(self.bn1(self.conv1(x)))
         x = F.relu(self.bn2(self.conv2(x)))
         x = F.relu(self.bn3(self.conv3(x)))
-        x = torch.max(x, 2)[0]  # (B, c3)
+        x = x.amax(dim=2)       # (B, c3); amax skips the argmax indices max() would also write
 
         x = F.relu(self.bn4(self.fc1(x))); x = self.drop1(x)
         x = F.relu(self.bn5(self.fc2(x))); x = self.drop2(x)
 
         raw = self.fc_out(x)    # (B, 6)
-        v_raw = raw[:, 0:3]
-        c_raw = raw[:, 3:6]
 
-        v = F.normalize(v_raw, dim=1, eps=1e-8)
+        # Canonicalize: v normalized, c made ⟂ v (fused helper)
+        return _canonicalize(raw)
 
-        # Canonicalize c so that c ⟂ v
-        dot = (c_raw * v).sum(dim=1, keepdim=True)
-        c = c_raw - dot * v
 
-        return v, c
+# ===================== Checkpoint loader ===================================
+
+def _fold_batchnorm(model: PointNetReg) -> None:
+    """
+    Folds each eval-mode BatchNorm1d into the preceding Conv1d/Linear and
+    replaces it with nn.Identity. In eval mode BN is just a per-channel
+    affine transform, so it can be absorbed into the layer's weight and a
+    new bias, removing 5 memory-bound BN kernels per forward.
+    """
+    pairs = [("conv1", "bn1"), ("conv2", "bn2"), ("conv3", "bn3"),
+             ("fc1", "bn4"), ("fc2", "bn5")]
 
+    with torch.no_grad():
+        for layer_name, bn_name in pairs:
+            layer = getattr(model, layer_name)
+            bn = getattr(model, bn_name)
 
-# ===================== Checkpoint loader ===================================
+            scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+
+            # (out,in,k) for Conv1d, (out,in) for Linear
+            shape = (-1,) + (1,) * (layer.weight.dim() - 1)
+            layer.weight.mul_(scale.view(shape))
+
+            bias = (layer.bias.detach() if layer.bias is not None
+                    else torch.zeros_like(bn.running_mean))
+            layer.bias = nn.Parameter((bias - bn.running_mean) * scale + bn.bias)
+
+            setattr(model, bn_name, nn.Identity())
 
-def load_checkpoint(checkpoint_path: str, device: torch.device) -> PointNetReg:
+
+def _load_eager(checkpoint_path: str, device: torch.device) -> PointNetReg:
+    """Loads the checkpoint into an eval-mode, BN-folded eager model."""
     ckpt = torch.load(checkpoint_path, map_location=device, weights_only=False)
     model = PointNetReg().to(device)
     model.load_state_dict(ckpt["model_state"])
     model.eval()
+
+    # Fold BN at module level (keeps the eager model lean too; the JIT pass
+    # below would otherwise only fold inside the scripted graph).
+    _fold_batchnorm(model)
     return model
 
 
+def load_checkpoint(checkpoint_path: str, device: torch.device):
+    model = _load_eager(checkpoint_path, device)
+
+    # On CPU, dynamically quantize the Linear layers to int8 so they hit
+    # FBGEMM/oneDNN VNNI kernels instead of FP32 BLAS. Must run after the
+    # BN fold so the folded weights are what gets quantized. (Conv1d has
+    # no dynamic quantization support, so the point-feature convs stay
+    # FP32.)
+    if device.type == "cpu":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=torch.qint8)
+
+    # Compile once instead of re-dispatching every op from eager each batch.
+    # optimize_for_inference freezes the module, folds eval-mode BatchNorm
+    # into the preceding convs/linears and removes the dropout layers.
+    model = torch.jit.script(model)
+    model = torch.jit.optimize_for_inference(model)
+
+    # Throwaway forward so the first real batch doesn't pay the JIT
+    # specialization cost.
+    with torch.inference_mode():
+        model(torch.zeros((2, 32, 3), dtype=torch.float32, device=device))
+
+    return model
+
+
+class OnnxRunner:
+    """
+    Runs inference through onnxruntime's CPU execution provider instead of
+    torch. For a model this small the per-op Python dispatch in torch
+    dominates CPU inference; ORT executes the whole fused graph in C++.
+    The BN-folded model is exported once to `onnx_path` (reused on later
+    runs) with dynamic batch and point-count axes.
+    """
+
+    def __init__(self, checkpoint_path: str, onnx_path: str):
+        import onnxruntime as ort  # optional dependency, only for --onnx
+
+        if not os.path.exists(onnx_path):
+            model = _load_eager(checkpoint_path, torch.device("cpu"))
+            dummy = torch.zeros((2, 32, 3), dtype=torch.float32)
+            torch.onnx.export(
+                model, dummy, onnx_path,
+                input_names=["points"], output_names=["v", "c"],
+                dynamic_axes={"points": {0: "B", 1: "N"},
+                              "v": {0: "B"}, "c": {0: "B"}})
+            print(f"[INFO] exported ONNX model: {onnx_path}")
+
+        self.sess = ort.InferenceSession(
+            onnx_path, providers=["CPUExecutionProvider"])
+
+    def run(self, x_np: np.ndarray):
+        """x_np: (B,N,3) float32 -> (v, c) numpy arrays, each (B,3)."""
+        v, c = self.sess.run(None, {"points": x_np})
+        return v, c
+
+
 # ===================== IO: parse beams =====================================
 
-def read_beams_text(path: str):
+def _iter_beam_sections(mm):
     """
-    Returns list of dicts:
-      { "id": int, "points": np.ndarray (Ni,3) float32 }
+    Yields (beam_id, coord_bytes) per beam section from a memory-mapped file.
+
+    Byte offsets are located with mm.find, so no copy of the file is made
+    except the per-beam coordinate slice handed to the parser.
     """
-    beams = []
-    cur_id = None
-    cur_pts = []
-
-    with open(path, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.strip()
-            if not line:
+    pos = 0
+    while True:
+        start = mm.find(b"beam", pos)
+        if start < 0:
+            return
+
+        # only "beam" at the start of a line opens a section ("endbeam"
+        # contains the same bytes)
+        if start > 0 and mm[start - 1:start] not in (b"\n", b"\r"):
+            pos = start + 4
+            continue
+
+        header_end = mm.find(b"\n", start)
+        if header_end < 0:
+            raise ValueError("Unterminated beam header at end of file")
+
+        # Validate the header instead of silently dropping or crashing on
+        # malformed ones ("beam" without an id, "beamX", non-numeric id).
+        header = mm[start:header_end].decode("ascii", "replace").rstrip()
+        fields = mm[start + 4:header_end].split()
+        if mm[start + 4:start + 5] not in (b" ", b"\t", b"\r", b"\n", b"") or not fields:
+            raise ValueError(f"Bad beam header: {header}")
+        try:
+            beam_id = int(fields[0])
+        except ValueError:
+            raise ValueError(f"Bad beam header: {header}") from None
+
+        end = mm.find(b"endbeam", header_end)
+        if end < 0:
+            raise ValueError(f"Beam {beam_id}: missing endbeam")
+
+        yield beam_id, mm[header_end + 1:end]
+        pos = end + len(b"endbeam")
+
+
+# Optional fast path: a numba-compiled byte tokenizer parses the coordinate
+# stream without any parser object or per-token Python/C glue. Falls back to
+# pandas' C engine when numba is not installed.
+try:
+    from numba import njit as _njit
+except ImportError:
+    _njit = None
+
+if _njit is not None:
+    # nogil: the producer thread must not hold the GIL while parsing, or
+    # it would serialize against the inference loop it is meant to overlap.
+    @_njit(cache=True, nogil=True)
+    def _tokenize_floats(buf, out):
+        """
+        Parses every whitespace-separated float in the uint8 array `buf`
+        into the flat float32 array `out`. Returns the number of floats
+        parsed, -1 if `out` is too small, or -(offset + 2) where offset is
+        the byte position of the first malformed token (bare sign/dot,
+        missing exponent digits, or an unrecognized byte).
+        """
+        n = buf.shape[0]
+        k = 0
+        i = 0
+        while i < n:
+            c = buf[i]
+            if c == 32 or c == 9 or c == 10 or c == 13:   # whitespace
+                i += 1
                 continue
 
-            if line.startswith("beam "):
-                parts = line.split()
-                if len(parts) < 2:
-                    raise ValueError(f"Bad beam header: {line}")
-                cur_id = int(parts[1])
-                cur_pts = []
-                continue
+            start = i
+            sign = 1.0
+            if c == 43:                                   # '+'
+                i += 1
+            elif c == 45:                                 # '-'
+                sign = -1.0
+                i += 1
+
+            val = 0.0
+            digits = 0
+            while i < n and 48 <= buf[i] <= 57:
+                val = val * 10.0 + (buf[i] - 48)
+                digits += 1
+                i += 1
+
+            if i < n and buf[i] == 46:                    # '.'
+                i += 1
+                place = 0.1
+                while i < n and 48 <= buf[i] <= 57:
+                    val += (buf[i] - 48) * place
+                    place *= 0.1
+                    digits += 1
+                    i += 1
+
+            if digits == 0:
+                # no mantissa digit: bare sign/dot or a byte no float
+                # starts with — report instead of emitting 0.0 (or, for a
+                # byte we never consume, spinning forever)
+                return -(start + 2)
+
+            if i < n and (buf[i] == 101 or buf[i] == 69):  # 'e' / 'E'
+                i += 1
+                esign = 1
+                if i < n and (buf[i] == 43 or buf[i] == 45):
+                    if buf[i] == 45:
+                        esign = -1
+                    i += 1
+                exp = 0
+                exp_digits = 0
+                while i < n and 48 <= buf[i] <= 57:
+                    exp = exp * 10 + (buf[i] - 48)
+                    exp_digits += 1
+                    i += 1
+                if exp_digits == 0:
+                    return -(start + 2)
+                val *= 10.0 ** (esign * exp)
+
+            if k >= out.shape[0]:
+                return -1
+            out[k] = sign * val
+            k += 1
+
+        return k
+
+
+def _parse_coords(buf: bytes) -> np.ndarray:
+    """Parses a whitespace-separated coordinate stream into (N,3) float32."""
+    if _njit is not None:
+        raw = np.frombuffer(buf, dtype=np.uint8)
+        # every float occupies at least 2 bytes (digit + separator)
+        out = np.empty(raw.shape[0] // 2 + 3, dtype=np.float32)
+        k = _tokenize_floats(raw, out)
+        if k == -1:
+            raise ValueError("Coordinate stream produced more values than its size allows")
+        if k < -1:
+            pos = -k - 2
+            context = buf[pos:pos + 16].decode("ascii", "replace")
+            raise ValueError(f"Bad coordinate token at byte {pos}: {context!r}")
+        if k % 3 != 0:
+            raise ValueError(f"Coordinate stream does not split into triples (got {k} values)")
+        return out[:k].reshape(-1, 3)
+
+    df = pd.read_csv(io.BytesIO(buf), engine="c", dtype=np.float32,
+                     header=None, sep=r"\s+")
+    return df.to_numpy()
+
+
+def _count_data_lines(block: bytes) -> int:
+    """Number of non-blank lines (= coordinate rows) in a beam block."""
+    return sum(1 for ln in block.splitlines() if ln.strip())
+
+
+def _parse_blocks(blocks):
+    """
+    Bulk-parses a list of coordinate blocks with one C-parser call.
+    Returns (points, offsets): points is (sum_Ni, 3) float32, block k is
+    points[offsets[k]:offsets[k+1]].
+    """
+    sizes = np.array([_count_data_lines(b) for b in blocks], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+
+    if blocks:
+        points = _parse_coords(b"\n".join(blocks))
+        if points.ndim != 2 or points.shape[1] != 3:
+            raise ValueError(f"Expected 3 coordinates per line, got shape {points.shape}")
+        if points.shape[0] != offsets[-1]:
+            raise ValueError(
+                f"Parsed {points.shape[0]} rows but counted {offsets[-1]} coordinate lines")
+        # The pandas C engine NaN-fills rows with fewer than 3 fields
+        # rather than erroring, which would silently become NaN
+        # predictions downstream.
+        if not np.isfinite(points).all():
+            bad = int(np.where(~np.isfinite(points).all(axis=1))[0][0])
+            raise ValueError(f"Bad point line: coordinate row {bad} is incomplete or non-finite")
+    else:
+        points = np.empty((0, 3), dtype=np.float32)
+
+    return points, offsets
+
+
+def read_beams_text(path: str, concat: bool = False):
+    """
+    Default: returns list of dicts:
+      { "id": int, "points": np.ndarray (Ni,3) float32 }
 
-            if line == "endbeam":
-                if cur_id is None:
-                    continue
-                if len(cur_pts) == 0:
-                    cur_id = None
-                    cur_pts = []
-                    continue
+    With concat=True, returns (ids, points, offsets) instead:
+      ids     : list of beam ids
+      points  : one contiguous (sum_Ni, 3) float32 array for all beams
+      offsets : (len(ids)+1,) int array; beam k is points[offsets[k]:offsets[k+1]]
 
-                pts = np.asarray(cur_pts, dtype=np.float32)
-                if pts.ndim != 2 or pts.shape[1] != 3:
-                    raise ValueError(f"Beam {cur_id}: Expected (N,3), got {pts.shape}")
+    The file is memory-mapped, beam boundaries are found with a cheap byte
+    scan, and then ALL coordinates go through one C-parser call; parser
+    setup cost is amortized across the whole file instead of paid per
+    beam. Per-beam boundaries come from a line count per block.
 
-                beams.append({"id": cur_id, "points": pts})
-                cur_id = None
-                cur_pts = []
-                continue
+    Note: this holds every beam in memory at once. The inference pipeline
+    uses the bounded-memory iter_beam_batches generator instead.
+    """
+    ids = []
+    blocks = []
 
-            # coordinate line
-            parts = line.split()
-            if len(parts) < 3:
-                raise ValueError(f"Bad point line: {line}")
-            x, y, z = float(parts[0]), float(parts[1]), float(parts[2])
-            cur_pts.append([x, y, z])
+    with open(path, "rb") as f:
+        # mmap refuses zero-length files; treat them as containing no beams
+        if os.fstat(f.fileno()).st_size > 0:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for beam_id, block in _iter_beam_sections(mm):
+                    if not block.strip():
+                        # empty beam section, skip (same as the old parser)
+                        continue
+                    ids.append(beam_id)
+                    blocks.append(block)
+            finally:
+                mm.close()
 
-    return beams
+    points, offsets = _parse_blocks(blocks)
 
+    if concat:
+        return ids, points, offsets
 
-def write_results_text(path: str, results):
+    return [{"id": i, "points": pts}
+            for i, pts in zip(ids, np.split(points, offsets[1:-1]))]
+
+
+def _cat(*parts):
+    """Elementwise string concatenation of arrays/scalars via np.char.add."""
+    out = parts[0]
+    for p in parts[1:]:
+        out = np.char.add(out, p)
+    return out
+
+
+def write_results_text(path: str, ids, C, V, t1=0.0, t2=0.0):
     """
-    results: list of dicts:
-      { id, c(3), v(3), t1, t2 }
+    ids : sequence of beam ids (length N)
+    C   : (N,3) predicted axis points
+    V   : (N,3) predicted axis directions
+
+    All numbers are formatted in one np.char.mod call (numpy's C float
+    formatter) and the file is written as a single string, instead of five
+    f-string f.write calls per result.
     """
+    num = np.char.mod("%.6f", np.hstack([C, V]))    # (N,6) strings
+    id_str = np.asarray(ids, dtype=np.int64).astype(str)
+    t_tail = "\nt %.6f %.6f\nendresult" % (t1, t2)
+
+    blocks = _cat("result ", id_str,
+                  "\nc ", num[:, 0], " ", num[:, 1], " ", num[:, 2],
+                  "\nv ", num[:, 3], " ", num[:, 4], " ", num[:, 5],
+                  t_tail)
+
     with open(path, "w", encoding="utf-8") as f:
-        for r in results:
-            f.write(f"result {r['id']}\n")
-            c = r["c"]; v = r["v"]
-            f.write(f"c {c[0]:.6f} {c[1]:.6f} {c[2]:.6f}\n")
-            f.write(f"v {v[0]:.6f} {v[1]:.6f} {v[2]:.6f}\n")
-            f.write(f"t {r['t1']:.6f} {r['t2']:.6f}\n")
-            f.write("endresult\n")
+        f.write("\n".join(blocks))
+        f.write("\n")
 
 
 # ===================== Batch inference =====================================
 
+class CudaGraphRunner:
+    """
+    Wraps the model and captures one CUDA Graph per padded batch shape,
+    replaying it for later batches with the same shape. Replay submits the
+    whole forward as one unit, eliminating the ~20 per-kernel CPU launch
+    latencies that dominate this small model's GPU time. Bucketing by point
+    count (see main) makes repeated shapes common.
+    """
+
+    # Hard cap on captured graphs: each one permanently retains a private
+    # CUDA memory pool, so an unexpected spread of shapes must not grow
+    # the cache without bound. Padded lengths are rounded to
+    # _PAD_GRANULARITY upstream, so this is rarely reached.
+    _MAX_GRAPHS = 32
+
+    def __init__(self, model):
+        self.model = model
+        self._graphs = {}  # (B, N) -> (graph, static_x, static_v, static_c)
+
+    def __call__(self, x):
+        key = (x.shape[0], x.shape[1])
+        entry = self._graphs.get(key)
+
+        if entry is None:
+            if len(self._graphs) >= self._MAX_GRAPHS:
+                # eager fallback: warmup + capture would cost more than it
+                # saves for a shape this rare
+                return self.model(x)
+
+            static_x = x.clone()
+
+            # Warm up on a side stream, as required before graph capture.
+            s = torch.cuda.Stream()
+            s.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(s):
+                for _ in range(2):
+                    self.model(static_x)
+            torch.cuda.current_stream().wait_stream(s)
+
+            g = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(g):
+                static_v, static_c = self.model(static_x)
+
+            # Capture only records the kernels; the static outputs hold
+            # garbage until the graph actually runs. static_x already has
+            # this batch's data (clone above), so replay once for it.
+            g.replay()
+
+            entry = (g, static_x, static_v, static_c)
+            self._graphs[key] = entry
+            return static_v, static_c
+
+        g, static_x, static_v, static_c = entry
+        static_x.copy_(x)
+        g.replay()
+        return static_v, static_c
+
+
 def pad_points(beams, target_n=None):
     """
     Builds a batch array (B, N, 3) by padding/truncating.
     If target_n is None, uses max N within the batch.
-    Returns: x (B,N,3) float32, mask (B,N) bool, and list of original N.
+    Returns: x (B,N,3) float32 and list of original N.
+
+    No validity mask is returned: the model never consumed one (the
+    max-pool runs over real and padding rows alike, and a zero point's
+    activations CAN win the pool — the conv biases make them nonzero), so
+    this matches the trained behavior. The amount of padding does affect
+    the features seen by the pool; it is not output-neutral.
     """
     sizes = [b["points"].shape[0] for b in beams]
     if target_n is None:
@@ -204,19 +569,112 @@ def pad_points(beams, target_n=None):
 
     B = len(beams)
     x = np.zeros((B, target_n, 3), dtype=np.float32)
-    mask = np.zeros((B, target_n), dtype=np.bool_)
 
-    for i, b in enumerate(beams):
-        pts = b["points"]
-        n = pts.shape[0]
-        if n >= target_n:
-            x[i, :, :] = pts[:target_n, :]
-            mask[i, :] = True
-        else:
-            x[i, :n, :] = pts
-            mask[i, :n] = True
+    # Scatter all beams in one vectorized assignment instead of a
+    # per-beam Python copy loop.
+    kept = np.minimum(sizes, target_n)
+    concat = np.concatenate([b["points"][:target_n] for b in beams])
+    row_idx = np.repeat(np.arange(B), kept)
+    col_idx = np.concatenate([np.arange(n) for n in kept])
+
+    x[row_idx, col_idx] = concat
+
+    return x, sizes
+
+
+# Bounded queue depth: caps how many padded batches the producer can run
+# ahead of inference, keeping peak memory at O(depth * batch).
+_QUEUE_DEPTH = 4
+
+# How many batches' worth of beams are buffered, bulk-parsed, and
+# size-sorted together. Beams only leave memory once their window is
+# consumed, so peak RSS is O(window x points) regardless of file size,
+# while sorting within the window keeps most of the bucketing benefit.
+_BUCKET_WINDOW = 16
 
-    return x, mask, sizes
+# On CUDA, padded batch lengths are rounded up to a multiple of this.
+# Exact max point counts rarely repeat on variable-length inputs, and the
+# per-shape CUDA Graph and device-buffer caches only pay off when shapes
+# do repeat; rounding trades a sliver of padding work for a small,
+# recurring set of shapes. CPU and ONNX runs have no per-shape caches and
+# pad exactly (the extra conv work would buy nothing there).
+_PAD_GRANULARITY = 256
+
+
+def iter_beam_batches(path: str, batch_size: int, pad_multiple: int = 1):
+    """
+    Streams the input file and yields one (batch_idx, batch_ids, x_np)
+    tuple per padded batch:
+      batch_idx : global input-order ordinals of the beams in the batch
+      batch_ids : their beam ids
+      x_np      : padded (B,N,3) float32 batch
+
+    Beams are collected into windows of batch_size * _BUCKET_WINDOW, each
+    window is parsed with one C-parser call and sorted by point count
+    before batching, then released — the whole file is never resident at
+    once. Padded lengths are rounded up to pad_multiple (see
+    _PAD_GRANULARITY; only worthwhile for the CUDA pipeline).
+    """
+    def emit(ids, blocks, base):
+        points, offsets = _parse_blocks(blocks)
+        beams = [{"id": i, "points": pts}
+                 for i, pts in zip(ids, np.split(points, offsets[1:-1]))]
+
+        sizes = offsets[1:] - offsets[:-1]
+        order = np.argsort(sizes, kind="stable")
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            n_max = int(sizes[batch_idx].max())
+            target_n = -(-n_max // pad_multiple) * pad_multiple
+            x_np, _ = pad_points([beams[j] for j in batch_idx], target_n=target_n)
+            yield base + batch_idx, [beams[j]["id"] for j in batch_idx], x_np
+
+    window = batch_size * _BUCKET_WINDOW
+    ids = []
+    blocks = []
+    base = 0
+
+    with open(path, "rb") as f:
+        # mmap refuses zero-length files; an empty input simply yields no
+        # batches and main raises its usual "No beams found" error.
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for beam_id, block in _iter_beam_sections(mm):
+                if not block.strip():
+                    continue
+                ids.append(beam_id)
+                blocks.append(block)
+                if len(ids) >= window:
+                    yield from emit(ids, blocks, base)
+                    base += len(ids)
+                    ids = []
+                    blocks = []
+            if ids:
+                yield from emit(ids, blocks, base)
+        finally:
+            mm.close()
+
+
+def _produce_batches(path: str, batch_size: int, pad_multiple: int, q: queue.Queue):
+    """
+    Producer thread: streams padded batches from iter_beam_batches into a
+    bounded queue so parsing/padding overlaps with GPU (or CPU) compute.
+    Results are written back at their original index in main, so the
+    output order is unchanged by the size-bucketing.
+
+    Queue protocol: ("batch", batch_idx, batch_ids, x_np) per batch, then
+    ("done",). Exceptions are forwarded as ("error", exc) and re-raised
+    in main.
+    """
+    try:
+        for batch_idx, batch_ids, x_np in iter_beam_batches(path, batch_size,
+                                                            pad_multiple):
+            q.put(("batch", batch_idx, batch_ids, x_np))
+        q.put(("done",))
+    except BaseException as exc:  # forwarded to main, never swallowed
+        q.put(("error", exc))
 
 
 def main():
@@ -225,46 +683,152 @@ def main():
     parser.add_argument("--output", required=True, help="Path to output result text file.")
     parser.add_argument("--checkpoint", required=True, help="Path to trained model checkpoint (.pt).")
     parser.add_argument("--batch_size", type=int, default=32, help="Mini-batch size for inference.")
+    parser.add_argument("--onnx", default=None,
+                        help="Optional path to an .onnx model; exports it on first use "
+                             "and runs inference with onnxruntime on CPU.")
     args = parser.parse_args()
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"[INFO] device = {device}")
-
-    beams = read_beams_text(args.input)
-    if len(beams) == 0:
-        raise RuntimeError("No beams found in input file.")
-
-    model = load_checkpoint(args.checkpoint, device)
+    use_onnx = args.onnx is not None
+    if use_onnx:
+        device = torch.device("cpu")    # ORT CPU path; torch buffers unused
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"[INFO] device = {device}" + (" (onnxruntime)" if use_onnx else ""))
+
+    # Parsing and padding run in a producer thread; the checkpoint load
+    # below and the inference loop overlap with them.
+    # Coarse pad buckets only help the CUDA per-shape caches repeat; on
+    # CPU/ONNX exact padding avoids inflating the conv work.
+    pad_multiple = _PAD_GRANULARITY if device.type == "cuda" else 1
+
+    q = queue.Queue(maxsize=_QUEUE_DEPTH)
+    producer = threading.Thread(target=_produce_batches,
+                                args=(args.input, args.batch_size,
+                                      pad_multiple, q),
+                                daemon=True)
+    producer.start()
+
+    if use_onnx:
+        model = OnnxRunner(args.checkpoint, args.onnx)
+    else:
+        model = load_checkpoint(args.checkpoint, device)
+        if device.type == "cuda":
+            model = CudaGraphRunner(model)
     print(f"[INFO] loaded checkpoint: {args.checkpoint}")
-    print(f"[INFO] beams = {len(beams)}")
 
     # Currently unused (kept for output compatibility)
     t1 = 0.0
     t2 = 0.0
 
-    results = []
-    with torch.no_grad():
-        for start in range(0, len(beams), args.batch_size):
-            batch = beams[start:start + args.batch_size]
-
-            x_np, _, _ = pad_points(batch, target_n=None)   # (B,N,3)
-            x = torch.from_numpy(x_np).to(device)           # float32
-
-            v_pred, c_pred = model(x)                       # (B,3), (B,3)
-            v = v_pred.detach().cpu().numpy()
-            c = c_pred.detach().cpu().numpy()
-
-            for i, b in enumerate(batch):
-                results.append({
-                    "id": b["id"],
-                    "c": c[i],
-                    "v": v[i],
-                    "t1": float(t1),
-                    "t2": float(t2),
-                })
-
-    write_results_text(args.output, results)
-    print(f"[OK] wrote {len(results)} results to: {args.output}")
+    # On CUDA, stage batches in a pinned (page-locked) host buffer so the
+    # H2D copy can run async (non_blocking) and overlap with the previous
+    # batch's kernels. A pageable torch.from_numpy(...).to(device) copy
+    # would block instead. Beams now stream in, so the largest point count
+    # is not known upfront; the buffer is grown on demand and reused.
+    host_buf = None
+    out_buf = None
+    if device.type == "cuda":
+        # Pinned landing buffer for predictions: v and c are stacked on
+        # device and brought back in one async D2H copy per batch instead
+        # of two synchronous .cpu() calls.
+        out_buf = torch.empty((args.batch_size, 2, 3),
+                              dtype=torch.float32, pin_memory=True)
+
+    # Run the forward pass in fp16 on GPU (tensor cores); outputs are cast
+    # back to fp32 before leaving torch, and the final normalize/
+    # orthogonalize keeps the accuracy loss negligible. On CPU autocast is
+    # disabled: the Linear layers are int8-quantized there and expect fp32
+    # inputs.
+    use_amp = device.type == "cuda"
+
+    # Device-side input tensors, one per padded batch shape, reused across
+    # batches. Avoids a fresh CUDA allocation per batch (which fragments
+    # the caching allocator when sizes vary) and gives CUDA Graph replay a
+    # stable source to copy from. Bucketing keeps the number of distinct
+    # shapes small.
+    dev_bufs = {}
+
+    # Per-batch accumulators; results are reassembled in input order once
+    # at the end instead of appending a dict per beam inside the loop.
+    # Only the (B,3) predictions and ids accumulate — point data is gone
+    # as soon as its batch has run.
+    all_idx = []
+    all_ids = []
+    all_v = []
+    all_c = []
+
+    # inference_mode is stricter (and cheaper) than no_grad: it also skips
+    # version-counter and view-tracking bookkeeping on every op.
+    with torch.inference_mode():
+        while True:
+            item = q.get()
+            if item[0] == "error":
+                raise item[1]
+            if item[0] == "done":
+                break
+            _, batch_idx, batch_ids, x_np = item            # x_np: (B,N,3)
+            all_ids.append(batch_ids)
+
+            if use_onnx:
+                # ORT consumes the numpy batch directly; no torch round-trip.
+                v_np, c_np = model.run(x_np)
+                all_idx.append(batch_idx)
+                all_v.append(v_np)
+                all_c.append(c_np)
+                continue
+
+            if device.type == "cuda":
+                B, N = x_np.shape[0], x_np.shape[1]
+                if host_buf is None or host_buf.shape[1] < N:
+                    host_buf = torch.empty((args.batch_size, N, 3),
+                                           dtype=torch.float32, pin_memory=True)
+                staged = host_buf[:B, :N]
+                staged.copy_(torch.from_numpy(x_np))
+                x = dev_bufs.get((B, N))
+                if x is None:
+                    x = dev_bufs.setdefault(
+                        (B, N), torch.empty((B, N, 3), dtype=torch.float32,
+                                            device=device))
+                x.copy_(staged, non_blocking=True)
+            else:
+                x = torch.from_numpy(x_np).to(device)       # float32
+
+            # cache_enabled=False: CUDA Graph capture happens inside this
+            # region, and capturing with autocast's weight-cast cache on is
+            # unsupported (cached casts can be baked into or dropped from
+            # the captured graph).
+            with torch.autocast(device_type=device.type, dtype=torch.float16,
+                                enabled=use_amp, cache_enabled=False):
+                v_pred, c_pred = model(x)                   # (B,3), (B,3)
+            all_idx.append(batch_idx)
+            if out_buf is not None:
+                B = x_np.shape[0]
+                vc_dev = torch.stack((v_pred, c_pred), dim=1).float()
+                out_buf[:B].copy_(vc_dev, non_blocking=True)
+                torch.cuda.current_stream().synchronize()
+                vc = out_buf[:B].numpy().copy()     # buffer is reused next batch
+                all_v.append(vc[:, 0])
+                all_c.append(vc[:, 1])
+            else:
+                all_v.append(v_pred.float().detach().cpu().numpy())
+                all_c.append(c_pred.float().detach().cpu().numpy())
+
+    producer.join()
+
+    if not all_idx:
+        raise RuntimeError("No beams found in input file.")
+
+    # Undo the bucketing permutation with one vectorized gather.
+    idx = np.concatenate(all_idx)
+    inv = np.empty_like(idx)
+    inv[idx] = np.arange(len(idx))
+    ids = np.concatenate([np.asarray(i) for i in all_ids])[inv]
+    V = np.concatenate(all_v)[inv]              # (N_beams, 3), input order
+    C = np.concatenate(all_c)[inv]              # (N_beams, 3), input order
+
+    print(f"[INFO] beams = {len(ids)}")
+    write_results_text(args.output, ids, C, V, t1, t2)
+    print(f"[OK] wrote {len(ids)} results to: {args.output}")
 
 
 if __name__ == "__main__":